@@ -3,35 +3,20 @@ import streamlit as st
 import json
 import pdfplumber
 import io
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from docx import Document
 from datetime import datetime, timedelta
-from scoring_engine import calculate_hard_match_score, calculate_semantic_similarity, generate_gemini_feedback
+from scoring_engine import (
+    calculate_hard_match_score, calculate_semantic_similarity, generate_gemini_feedback,
+    normalize_skills_library
+)
 from database import (
     init_database, save_evaluation, get_all_evaluations, 
     search_evaluations, delete_evaluation, delete_all_evaluations, 
-    cleanup_old_records
+    cleanup_old_records, get_evaluation_feedback, get_evaluation_by_hash, HISTORY_PAGE_SIZE
 )
 
-# Helper function to safely load JSON data from the database
-# This remains useful as data is returned from the DB as a string representation of JSON
-def safe_json_loads(json_data, default_value=None):
-    """Safely loads a JSON object (or string), returning a default value if it fails."""
-    if default_value is None:
-        default_value = []
-    
-    if not json_data:
-        return default_value
-        
-    # If it's already a list or dict, just return it
-    if isinstance(json_data, (list, dict)):
-        return json_data
-        
-    try:
-        # If it's a string, try to load it
-        return json.loads(json_data)
-    except (json.JSONDecodeError, TypeError):
-        return default_value
-
 # --- Initialization ---
 # This will now initialize the PostgreSQL table
 init_database()
@@ -45,50 +30,69 @@ st.title("📊 Advanced Resume Relevance Checker")
 st.write("Professional-grade resume analysis using weighted scoring and semantic similarity.")
 
 # --- File Handling ---
+def _extract_page_text(page):
+    """Extracts one PDF page's text, then drops the page's parsed objects to keep memory flat."""
+    try:
+        return page.extract_text() or ""
+    finally:
+        page.close()  # flushes the object cache and the cached text map
+
+@st.cache_data(max_entries=32, ttl="1h")
+def _extract_text(file_bytes, filename, mime):
+    """Extracts text from raw file bytes. Cached so reruns don't re-parse the same upload."""
+    if mime == "application/pdf":
+        # Pages are extracted one at a time: pdfminer parses every page through the
+        # document's shared parser and stream, which is not safe to use from several threads
+        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+            page_texts = [_extract_page_text(page) for page in pdf.pages]
+        return "\n".join(t for t in page_texts if t)
+
+    if mime == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        doc = Document(io.BytesIO(file_bytes))
+        paragraph_texts = [p.text for p in doc.paragraphs if p.text.strip()]
+        cell_texts = [
+            cell.text
+            for table in doc.tables
+            for row in table.rows
+            for cell in row.cells
+            if cell.text.strip()
+        ]
+        return "\n".join(paragraph_texts + cell_texts)
+
+    # Assumes .txt
+    return str(file_bytes, "utf-8")
+
 def read_file(file):
     """Reads text content from uploaded PDF, DOCX, or TXT files."""
-    text = ""
-    file_type = file.type
-    
     try:
-        if file_type == "application/pdf":
-            with pdfplumber.open(file) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                        
-        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            docx_file = io.BytesIO(file.read())
-            doc = Document(docx_file)
-            
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text += paragraph.text + "\n"
-            
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text += cell.text + "\n"
-            
-        else: # Assumes .txt
-            text = str(file.read(), "utf-8")
-            
+        return _extract_text(file.getvalue(), file.name, file.type)
     except Exception as e:
         st.error(f"Error reading file '{file.name}': {str(e)}")
         return ""
-    
-    return text
 
 # --- Load Skills Data ---
-@st.cache_data
+# cache_resource, not cache_data: the library (and its automaton) is read-only, so every
+# rerun can share one object instead of unpickling a fresh copy
+@st.cache_resource
 def load_skills_data():
     with open('skills.json', 'r') as f:
-        return json.load(f)
+        return normalize_skills_library(json.load(f))
 
 skills_library = load_skills_data()
 
+# --- Cached Scoring ---
+# Reruns (deletes, filter changes) re-enter the analysis flow with the same texts,
+# so reuse previous results instead of recomputing the transformer pass.
+# Both run on worker threads, which have no ScriptRunContext to draw cache spinners with;
+# the analysis spinner already covers them.
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_hard_match_score(jd_text, resume_text, _skills_library):
+    return calculate_hard_match_score(jd_text, resume_text, _skills_library)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_semantic_similarity(jd_text, resume_text):
+    return calculate_semantic_similarity(jd_text, resume_text)
+
 # --- Sidebar ---
 with st.sidebar:
     st.header("Upload Files")
@@ -134,7 +138,9 @@ with st.sidebar:
 # --- Main Page Tabs ---
 tab1, tab2 = st.tabs(["🧪 New Evaluation", "📊 Evaluation History"])
 
-with tab1:
+# The analysis runs as part of the full script, so the history tab below re-renders in the
+# same run and shows the evaluation it just saved
+def _new_evaluation_tab():
     st.header("Run New Analysis")
     if st.button("Run Advanced Analysis 🚀", type="primary"):
         if uploaded_jd and uploaded_resume:
@@ -144,8 +150,12 @@ with tab1:
 
                 if jd_text and resume_text:
                     # --- Scoring and Analysis ---
-                    hard_score, score_breakdown = calculate_hard_match_score(jd_text, resume_text, skills_library)
-                    semantic_score = calculate_semantic_similarity(jd_text, resume_text)
+                    # Hard match and semantic similarity are independent, so run them side by side
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        hard_future = executor.submit(cached_hard_match_score, jd_text, resume_text, skills_library)
+                        semantic_future = executor.submit(cached_semantic_similarity, jd_text, resume_text)
+                        hard_score, score_breakdown = hard_future.result()
+                        semantic_score = semantic_future.result()
                     final_score = (hard_score * 0.45) + (semantic_score * 0.55)
 
                     # --- AI Feedback Generation ---
@@ -154,8 +164,14 @@ with tab1:
                         all_required = score_breakdown['must_have_skills'].union(score_breakdown['good_to_have_skills'])
                         all_missing = all_required - all_found
                         
+                        # The same JD/resume pair always scores the same, so earlier feedback can be reused
+                        content_hash = hashlib.sha1(uploaded_jd.getvalue() + b'|' + uploaded_resume.getvalue()).hexdigest()
+                        existing = get_evaluation_by_hash(content_hash)
+                        
                         api_key = st.secrets.get("GEMINI_API_KEY")
-                        if api_key:
+                        if existing and existing['ai_feedback'] and not existing['ai_feedback'].startswith("⚠️"):
+                            ai_feedback = existing['ai_feedback']
+                        elif api_key:
                             ai_feedback = generate_gemini_feedback(
                                 jd_text, resume_text, all_missing, final_score, all_found, api_key=api_key
                             )
@@ -171,7 +187,8 @@ with tab1:
                         'found_must_have_skills': score_breakdown['found_must_have'],
                         'good_to_have_skills': score_breakdown['good_to_have_skills'],
                         'found_good_to_have_skills': score_breakdown['found_good_to_have'],
-                        'ai_feedback': ai_feedback
+                        'ai_feedback': ai_feedback,
+                        'content_hash': content_hash
                     }
                     save_evaluation(result_data)
 
@@ -202,16 +219,14 @@ with tab1:
                     with c1:
                         st.write("**Must-Have Skills:**")
                         if must_have:
-                            for skill in must_have:
-                                st.write(f"{'✅' if skill in found_must else '❌'} {skill}")
+                            st.markdown("\n\n".join(f"{'✅' if skill in found_must else '❌'} {skill}" for skill in must_have))
                         else:
                             st.write("None specified in JD.")
                             
                     with c2:
                         st.write("**Good-to-Have Skills:**")
                         if good_to_have:
-                            for skill in good_to_have:
-                                st.write(f"{'✅' if skill in found_good else '➖'} {skill}")
+                            st.markdown("\n\n".join(f"{'✅' if skill in found_good else '➖'} {skill}" for skill in good_to_have))
                         else:
                             st.write("None specified in JD.")
                     
@@ -228,20 +243,37 @@ with tab1:
         else:
             st.warning("Please upload both a Job Description and a Resume to begin.")
 
-with tab2:
+# History is a fragment: searching, paging and deleting rerun only this tab, not the uploads
+@st.fragment
+def _history_fragment():
     st.header("📜 Evaluation History")
     
     c1, c2 = st.columns([3, 1])
     search_term = c1.text_input("🔍 Search by filename or verdict:")
     verdict_filter = c2.selectbox("Filter by verdict:", ["All", "HIGH FIT", "MEDIUM FIT", "LOW FIT"])
     
-    evaluations = search_evaluations(search_term) if search_term else get_all_evaluations()
+    # Keyset pagination: the cursor is the (timestamp, id) of the last row on the previous page
+    if st.session_state.get('history_filters') != (search_term, verdict_filter):
+        st.session_state.history_filters = (search_term, verdict_filter)
+        st.session_state.history_cursor = None
+    cursor = st.session_state.get('history_cursor')
     
-    if verdict_filter != "All":
-        evaluations = [e for e in evaluations if e['verdict'] == verdict_filter]
+    verdict = None if verdict_filter == "All" else verdict_filter
+    if search_term:
+        evaluations = search_evaluations(search_term, before=cursor, verdict=verdict)
+    else:
+        evaluations = get_all_evaluations(before=cursor, verdict=verdict)
+    
+    nav1, nav2 = st.columns(2)
+    if cursor and nav1.button("⬅️ Back to Newest"):
+        st.session_state.history_cursor = None
+        st.rerun(scope="fragment")
+    if len(evaluations) == HISTORY_PAGE_SIZE and nav2.button("Older Evaluations ➡️"):
+        st.session_state.history_cursor = (evaluations[-1]['timestamp'], evaluations[-1]['id'])
+        st.rerun(scope="fragment")
     
     if evaluations:
-        st.write(f"**Found {len(evaluations)} evaluations**")
+        st.write(f"**Showing {len(evaluations)} evaluations**")
         
         for eval_item in evaluations:
             timestamp_str = eval_item['timestamp'].strftime('%Y-%m-%d %H:%M')
@@ -259,35 +291,39 @@ with tab2:
                 st.subheader("Skills Analysis")
                 c3, c4 = st.columns(2)
                 
-                must_have = safe_json_loads(eval_item['must_have_skills'])
-                found_must = safe_json_loads(eval_item['found_must_have_skills'])
-                missing_must = list(set(must_have) - set(found_must))
+                must_have = eval_item['must_have_skills'] or []
+                found_must = eval_item['found_must_have_skills'] or []
+                missing_must = eval_item['missing_must_have'] or []
                 
                 with c3:
                     st.write("**Must-Have Skills Found:**")
                     if found_must:
-                        for skill in found_must:
-                            st.write(f"✅ {skill}")
+                        st.markdown("\n\n".join(f"✅ {skill}" for skill in found_must))
                     else:
                         st.write("None")
 
                 with c4:
                     st.write("**Must-Have Skills Missing:**")
                     if missing_must:
-                        for skill in missing_must:
-                            st.write(f"❌ {skill}")
+                        st.markdown("\n\n".join(f"❌ {skill}" for skill in missing_must))
                     elif must_have:
                         st.write("All skills found! 👍")
                     else:
                         st.write("No 'must-have' skills defined.")
                 
-                if eval_item['ai_feedback']:
-                    with st.expander("🤖 AI Feedback"):
-                        st.markdown(eval_item['ai_feedback'])
+                # Feedback text can be large, so it is only fetched once the user asks for it
+                if eval_item['has_feedback'] and st.toggle("🤖 Show AI Feedback", key=f"feedback_{eval_item['id']}"):
+                    st.markdown(get_evaluation_feedback(eval_item['id']))
                 
                 if st.button("🗑️ Delete This Entry", key=f"delete_{eval_item['id']}"):
                     delete_evaluation(eval_item['id'])
                     st.success(f"Evaluation for '{eval_item['resume_filename']}' deleted!")
-                    st.rerun()
+                    st.rerun(scope="fragment")
     else:
         st.info("No evaluations found. Run a new analysis or clear your search filters.")
+
+with tab1:
+    _new_evaluation_tab()
+
+with tab2:
+    _history_fragment()
@@ -1,8 +1,12 @@
 # database.py - Handles all database operations for PostgreSQL with Neon.tech
 import psycopg2
 import psycopg2.extras # to fetch data as dictionaries
+import psycopg2.pool
+import streamlit as st
+import atexit
 import os
-import json
+import threading
+import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from urllib.parse import urlparse
@@ -10,96 +14,308 @@ from urllib.parse import urlparse
 # Load environment variables from .env file
 load_dotenv()
 
+# Number of evaluations shown per page in the history tab
+HISTORY_PAGE_SIZE = 25
+# Seconds to wait for a pooled connection before giving up with PoolError
+POOL_TIMEOUT_SECONDS = 30
+# Pooled connections idle for longer than this are pinged before reuse
+POOL_IDLE_PING_SECONDS = 60
+
+class _BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool that waits up to POOL_TIMEOUT_SECONDS for a free connection
+    instead of raising PoolError as soon as all of them are in use.
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._returned_at = {}
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=POOL_TIMEOUT_SECONDS):
+            raise psycopg2.pool.PoolError(f"no database connection became free within {POOL_TIMEOUT_SECONDS}s")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        if conn.closed:
+            self._returned_at.pop(id(conn), None)
+        else:
+            self._returned_at[id(conn)] = time.monotonic()
+        self._slots.release()
+
+    def idle_seconds(self, conn):
+        """Seconds since conn was last returned to the pool; 0 for a freshly opened connection."""
+        returned_at = self._returned_at.get(id(conn))
+        return 0 if returned_at is None else time.monotonic() - returned_at
+
+@st.cache_resource(validate=lambda pool: not pool.closed)
+def _get_pool():
+    """Creates a shared connection pool to the Neon.tech PostgreSQL database, once per process."""
+    # Parse the DATABASE_URL to handle Neon's connection requirements
+    db_url = os.environ['DATABASE_URL']
+    result = urlparse(db_url)
+    
+    # Create the pool with required parameters for Neon
+    pool = _BlockingConnectionPool(
+        1, 10,
+        dbname=result.path[1:],  # Remove the leading '/'
+        user=result.username,
+        password=result.password,
+        host=result.hostname,
+        port=result.port,
+        sslmode='require',  # Neon requires SSL
+        # TCP keepalives stop NAT/proxies from silently dropping connections idling in the pool
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=5
+    )
+    atexit.register(pool.closeall)
+    return pool
+
+def _is_alive(conn):
+    """Pings a pooled connection. psycopg2 only marks a connection closed after a query on it fails."""
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_db_connection():
-    """Establishes a connection to the Neon.tech PostgreSQL database."""
+    """Borrows a live connection from the shared pool. Return it with _put_conn()."""
     try:
-        # Parse the DATABASE_URL to handle Neon's connection requirements
-        db_url = os.environ['DATABASE_URL']
-        result = urlparse(db_url)
-        
-        # Extract connection parameters
-        username = result.username
-        password = result.password
-        database = result.path[1:]  # Remove the leading '/'
-        hostname = result.hostname
-        port = result.port
-        
-        # Create connection string with required parameters for Neon
-        conn = psycopg2.connect(
-            dbname=database,
-            user=username,
-            password=password,
-            host=hostname,
-            port=port,
-            sslmode='require'  # Neon requires SSL
-        )
-        return conn
+        pool = _get_pool()
+        # Neon drops connections when its compute auto-suspends; discard dead ones until the
+        # pool hands out a live (or freshly opened) connection. Only connections that sat idle
+        # long enough to have been dropped pay for the ping round-trips.
+        for _ in range(pool.maxconn + 1):
+            conn = pool.getconn()
+            if pool.idle_seconds(conn) < POOL_IDLE_PING_SECONDS and not conn.closed:
+                return conn
+            if _is_alive(conn):
+                return conn
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("no live database connection available")
+    except psycopg2.pool.PoolError:
+        # Every connection is busy (or leaked); fail loudly rather than silently dropping the query
+        raise
     except Exception as e:
         print(f"Error connecting to the database: {e}")
         # In a Streamlit app, you might want to show an error message
         # st.error(f"Database connection error: {e}")
         return None
 
+def _put_conn(conn):
+    """Returns a connection to the pool (the pool rolls back any open transaction)."""
+    _get_pool().putconn(conn)
+
+def _optional_ddl(cur, description, *statements):
+    """Runs schema changes the app can work without (extensions, speed-up indexes); failures are logged, not raised."""
+    cur.execute('SAVEPOINT optional_ddl')
+    try:
+        for statement in statements:
+            cur.execute(statement)
+    except psycopg2.Error as e:
+        cur.execute('ROLLBACK TO SAVEPOINT optional_ddl')
+        print(f"Skipping {description}: {e}")
+    else:
+        cur.execute('RELEASE SAVEPOINT optional_ddl')
+
+@st.cache_resource(validate=lambda ready: ready)
 def init_database():
-    """Initialize the database and create the evaluations table if it doesn't exist."""
+    """
+    Initialize the database: create the evaluations table if it doesn't exist and apply pending migrations.
+    Runs once per process; returns False, so the next run retries, if the schema could not be set up.
+    """
     conn = get_db_connection()
     if not conn:
-        return
+        return False
         
-    with conn.cursor() as cur:
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS evaluations (
-            id SERIAL PRIMARY KEY,
-            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
-            job_description_filename VARCHAR(255) NOT NULL,
-            resume_filename VARCHAR(255) NOT NULL,
-            hard_score FLOAT NOT NULL,
-            semantic_score FLOAT NOT NULL,
-            final_score FLOAT NOT NULL,
-            verdict VARCHAR(50) NOT NULL,
-            must_have_skills JSONB,
-            found_must_have_skills JSONB,
-            good_to_have_skills JSONB, 
-            found_good_to_have_skills JSONB,
-            ai_feedback TEXT
-        )
-        ''')
-    conn.commit()
-    conn.close()
+    try:
+        with conn.cursor() as cur:
+            # Probe the schema first so each step below only runs (and only locks the table) when needed
+            cur.execute('''
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'evaluations'
+            ''')
+            columns = dict(cur.fetchall())
+            cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'evaluations'")
+            indexes = {row[0] for row in cur.fetchall()}
+
+            if not columns:
+                cur.execute('''
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    id SERIAL PRIMARY KEY,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                    job_description_filename VARCHAR(255) NOT NULL,
+                    resume_filename VARCHAR(255) NOT NULL,
+                    hard_score FLOAT NOT NULL,
+                    semantic_score FLOAT NOT NULL,
+                    final_score FLOAT NOT NULL,
+                    verdict VARCHAR(50) NOT NULL,
+                    must_have_skills TEXT[],
+                    found_must_have_skills TEXT[],
+                    good_to_have_skills TEXT[], 
+                    found_good_to_have_skills TEXT[],
+                    ai_feedback TEXT,
+                    content_hash CHAR(40)
+                )
+                ''')
+            # SHA-1 of the JD and resume bytes; re-running the same pair updates its row instead of adding one
+            if columns and 'content_hash' not in columns:
+                cur.execute('ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS content_hash CHAR(40)')
+            if 'idx_evaluations_content_hash' not in indexes:
+                cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_evaluations_content_hash ON evaluations (content_hash)')
+            # Older tables stored the skill lists as JSONB; convert them to native TEXT[] arrays
+            jsonb_columns = [name for name, data_type in columns.items() if data_type == 'jsonb']
+            if jsonb_columns:
+                # ALTER ... USING cannot contain a subquery, so wrap the conversion in a function.
+                # Rows saved as a double-encoded JSON string are unwrapped first.
+                cur.execute('''
+                CREATE OR REPLACE FUNCTION pg_temp.jsonb_to_text_array(j JSONB) RETURNS TEXT[]
+                LANGUAGE sql IMMUTABLE AS $$
+                    SELECT CASE jsonb_typeof(j)
+                        WHEN 'array' THEN ARRAY(SELECT jsonb_array_elements_text(j))
+                        WHEN 'string' THEN ARRAY(SELECT jsonb_array_elements_text((j #>> '{}')::jsonb))
+                        ELSE '{}'::TEXT[]
+                    END
+                $$
+                ''')
+                for column in jsonb_columns:
+                    cur.execute(
+                        f'ALTER TABLE evaluations ALTER COLUMN {column} TYPE TEXT[] '
+                        f'USING pg_temp.jsonb_to_text_array({column})'
+                    )
+            # Missing must-have skills are derived in the database so the history tab doesn't diff sets.
+            # Generated columns can't contain subqueries, hence the immutable helper function.
+            if 'missing_must_have' not in columns:
+                cur.execute('''
+                CREATE OR REPLACE FUNCTION text_array_except(a TEXT[], b TEXT[]) RETURNS TEXT[]
+                LANGUAGE sql IMMUTABLE AS $$
+                    SELECT ARRAY(
+                        SELECT x FROM unnest(a) WITH ORDINALITY AS t(x, i)
+                        WHERE x <> ALL(COALESCE(b, '{}'))
+                        ORDER BY i
+                    )
+                $$
+                ''')
+                cur.execute('''
+                ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS missing_must_have TEXT[]
+                GENERATED ALWAYS AS (text_array_except(must_have_skills, found_must_have_skills)) STORED
+                ''')
+            # Searchable text is kept in one generated column so search is a single ILIKE predicate
+            if 'search_doc' not in columns:
+                cur.execute('''
+                ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS search_doc TEXT
+                GENERATED ALWAYS AS (job_description_filename || ' ' || resume_filename || ' ' || verdict) STORED
+                ''')
+            # History is listed newest-first and paged on (timestamp, id), so index both columns in that order
+            if 'idx_evaluations_timestamp' in indexes:
+                cur.execute('DROP INDEX IF EXISTS idx_evaluations_timestamp')
+            if 'idx_evaluations_timestamp_id' not in indexes:
+                _optional_ddl(
+                    cur, "history index",
+                    'CREATE INDEX IF NOT EXISTS idx_evaluations_timestamp_id ON evaluations (timestamp DESC, id DESC)'
+                )
+            # Trigram index lets the unanchored ILIKE '%term%' search avoid a sequential scan
+            if 'idx_evaluations_search_trgm' in indexes:
+                cur.execute('DROP INDEX IF EXISTS idx_evaluations_search_trgm')
+            if 'idx_evaluations_search_doc_trgm' not in indexes:
+                _optional_ddl(
+                    cur, "trigram search index",
+                    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+                    '''
+                    CREATE INDEX IF NOT EXISTS idx_evaluations_search_doc_trgm
+                    ON evaluations USING gin (search_doc gin_trgm_ops)
+                    '''
+                )
+        conn.commit()
+        return True
+    except psycopg2.Error as e:
+        # e.g. another process applying the same migration at the same moment; retried on the next run
+        print(f"Error initializing the database: {e}")
+        return False
+    finally:
+        _put_conn(conn)
 
 # The rest of the functions remain the same as in your original file
 def save_evaluation(result_data):
     """Save an evaluation result to the database."""
-    conn = get_db_connection()
-    if not conn:
+    save_evaluations_bulk([result_data])
+
+def save_evaluations_bulk(results):
+    """
+    Save several evaluation results to the database in a single round-trip.
+    A result whose content_hash already exists replaces the stored evaluation.
+    """
+    if not results:
         return
 
-    with conn.cursor() as cur:
-        # Convert sets to lists for JSON serialization
-        must_have_skills = json.dumps(list(result_data.get('must_have_skills', [])))
-        found_must_have = json.dumps(list(result_data.get('found_must_have_skills', [])))
-        good_to_have_skills = json.dumps(list(result_data.get('good_to_have_skills', [])))
-        found_good_to_have = json.dumps(list(result_data.get('found_good_to_have_skills', [])))
-        
-        cur.execute('''
-        INSERT INTO evaluations (
-            timestamp, job_description_filename, resume_filename,
-            hard_score, semantic_score, final_score, verdict,
-            must_have_skills, found_must_have_skills,
-            good_to_have_skills, found_good_to_have_skills,
-            ai_feedback
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (
+    # One statement can't upsert the same row twice, so keep only the last result per hash
+    unhashed = [r for r in results if not r.get('content_hash')]
+    hashed = {r['content_hash']: r for r in results if r.get('content_hash')}
+    results = unhashed + list(hashed.values())
+
+    # Convert sets to lists; psycopg2 adapts lists to TEXT[] arrays
+    rows = [
+        (
             datetime.now(),
             result_data['jd_filename'], result_data['resume_filename'],
             result_data['hard_score'], result_data['semantic_score'], result_data['final_score'],
             result_data['verdict'],
-            must_have_skills, found_must_have,
-            good_to_have_skills, found_good_to_have,
-            result_data.get('ai_feedback', "")
-        ))
-    conn.commit()
-    conn.close()
+            list(result_data.get('must_have_skills') or []),
+            list(result_data.get('found_must_have_skills') or []),
+            list(result_data.get('good_to_have_skills') or []),
+            list(result_data.get('found_good_to_have_skills') or []),
+            result_data.get('ai_feedback', ""),
+            result_data.get('content_hash')
+        )
+        for result_data in results
+    ]
+
+    # Rows are built before borrowing a connection so a malformed result can't leak it
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, '''
+            INSERT INTO evaluations (
+                timestamp, job_description_filename, resume_filename,
+                hard_score, semantic_score, final_score, verdict,
+                must_have_skills, found_must_have_skills,
+                good_to_have_skills, found_good_to_have_skills,
+                ai_feedback, content_hash
+            ) VALUES %s
+            ON CONFLICT (content_hash) DO UPDATE SET
+                timestamp = EXCLUDED.timestamp,
+                job_description_filename = EXCLUDED.job_description_filename,
+                resume_filename = EXCLUDED.resume_filename,
+                hard_score = EXCLUDED.hard_score,
+                semantic_score = EXCLUDED.semantic_score,
+                final_score = EXCLUDED.final_score,
+                verdict = EXCLUDED.verdict,
+                must_have_skills = EXCLUDED.must_have_skills,
+                found_must_have_skills = EXCLUDED.found_must_have_skills,
+                good_to_have_skills = EXCLUDED.good_to_have_skills,
+                found_good_to_have_skills = EXCLUDED.found_good_to_have_skills,
+                ai_feedback = EXCLUDED.ai_feedback
+            ''', rows, page_size=100)
+        conn.commit()
+    finally:
+        _put_conn(conn)
+    _clear_evaluation_cache()
 
 def _fetch_all_as_dicts(query, params=()):
     """Helper function to fetch evaluations and return them as a list of dictionaries."""
@@ -107,25 +323,70 @@ def _fetch_all_as_dicts(query, params=()):
     if not conn:
         return []
         
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        cur.execute(query, params)
-        results = cur.fetchall()
-    conn.close()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute(query, params)
+            results = cur.fetchall()
+    finally:
+        _put_conn(conn)
     return [dict(row) for row in results]
 
-def get_all_evaluations():
-    """Retrieve all evaluations, ordered by most recent."""
-    return _fetch_all_as_dicts('SELECT * FROM evaluations ORDER BY timestamp DESC')
+def _clear_evaluation_cache():
+    """Invalidate cached history reads after the evaluations table changes."""
+    get_all_evaluations.clear()
+    search_evaluations.clear()
+    get_evaluation_feedback.clear()
+
+# Columns needed to list history rows; ai_feedback is fetched on demand by get_evaluation_feedback
+_HISTORY_COLUMNS = '''
+    id, timestamp, job_description_filename, resume_filename,
+    hard_score, semantic_score, final_score, verdict,
+    must_have_skills, found_must_have_skills, missing_must_have,
+    COALESCE(ai_feedback, '') <> '' AS has_feedback
+'''
+
+@st.cache_data(ttl="30s", max_entries=50)
+def get_all_evaluations(limit=HISTORY_PAGE_SIZE, before=None, verdict=None):
+    """
+    Retrieve one page of evaluations, ordered by most recent.
+    `before` is the (timestamp, id) of the last row on the previous page.
+    `verdict`, if given, restricts results to that verdict.
+    """
+    before_ts, before_id = before if before else (None, None)
+    query = f'''
+    SELECT {_HISTORY_COLUMNS} FROM evaluations
+    WHERE (%s IS NULL OR (timestamp, id) < (%s, %s))
+      AND (%s IS NULL OR verdict = %s)
+    ORDER BY timestamp DESC, id DESC
+    LIMIT %s
+    '''
+    return _fetch_all_as_dicts(query, (before_ts, before_ts, before_id, verdict, verdict, limit))
 
-def search_evaluations(search_term):
-    """Search evaluations by filename or verdict."""
-    query = '''
-    SELECT * FROM evaluations 
-    WHERE job_description_filename ILIKE %s OR resume_filename ILIKE %s OR verdict ILIKE %s
-    ORDER BY timestamp DESC
+@st.cache_data(ttl="30s", max_entries=50)
+def search_evaluations(search_term, limit=HISTORY_PAGE_SIZE, before=None, verdict=None):
+    """Search evaluations by filename or verdict, one page at a time (see get_all_evaluations)."""
+    before_ts, before_id = before if before else (None, None)
+    query = f'''
+    SELECT {_HISTORY_COLUMNS} FROM evaluations 
+    WHERE search_doc ILIKE %s
+      AND (%s IS NULL OR (timestamp, id) < (%s, %s))
+      AND (%s IS NULL OR verdict = %s)
+    ORDER BY timestamp DESC, id DESC
+    LIMIT %s
     '''
     like_term = f'%{search_term}%'
-    return _fetch_all_as_dicts(query, (like_term, like_term, like_term))
+    return _fetch_all_as_dicts(query, (like_term, before_ts, before_ts, before_id, verdict, verdict, limit))
+
+@st.cache_data(max_entries=100)
+def get_evaluation_feedback(evaluation_id):
+    """Retrieve the AI feedback text for a single evaluation."""
+    rows = _fetch_all_as_dicts('SELECT ai_feedback FROM evaluations WHERE id = %s', (evaluation_id,))
+    return rows[0]['ai_feedback'] if rows else None
+
+def get_evaluation_by_hash(content_hash):
+    """Retrieve the stored evaluation for a JD/resume content hash, or None."""
+    rows = _fetch_all_as_dicts('SELECT * FROM evaluations WHERE content_hash = %s', (content_hash,))
+    return rows[0] if rows else None
 
 def delete_evaluation(evaluation_id):
     """Delete a specific evaluation by its ID."""
@@ -133,10 +394,13 @@ def delete_evaluation(evaluation_id):
     if not conn:
         return
         
-    with conn.cursor() as cur:
-        cur.execute('DELETE FROM evaluations WHERE id = %s', (evaluation_id,))
-    conn.commit()
-    conn.close()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM evaluations WHERE id = %s', (evaluation_id,))
+        conn.commit()
+    finally:
+        _put_conn(conn)
+    _clear_evaluation_cache()
 
 def delete_all_evaluations():
     """Delete all evaluations and reset the table's counter."""
@@ -144,10 +408,13 @@ def delete_all_evaluations():
     if not conn:
         return
         
-    with conn.cursor() as cur:
-        cur.execute('TRUNCATE TABLE evaluations RESTART IDENTITY')
-    conn.commit()
-    conn.close()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('TRUNCATE TABLE evaluations RESTART IDENTITY')
+        conn.commit()
+    finally:
+        _put_conn(conn)
+    _clear_evaluation_cache()
 
 def cleanup_old_records(days_to_keep):
     """Delete records from the database older than a specified number of days."""
@@ -155,10 +422,13 @@ def cleanup_old_records(days_to_keep):
     if not conn:
         return 0
         
-    with conn.cursor() as cur:
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        cur.execute('DELETE FROM evaluations WHERE timestamp < %s', (cutoff_date,))
-        deleted_count = cur.rowcount
-    conn.commit()
-    conn.close()
+    try:
+        with conn.cursor() as cur:
+            cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+            cur.execute('DELETE FROM evaluations WHERE timestamp < %s', (cutoff_date,))
+            deleted_count = cur.rowcount
+        conn.commit()
+    finally:
+        _put_conn(conn)
+    _clear_evaluation_cache()
     return deleted_count
\ No newline at end of file
@@ -1,80 +1,273 @@
 # scoring_engine.py - The brain of our advanced application
-import spacy
-from sentence_transformers import SentenceTransformer, util
 import re
+import sys
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import os
+import hashlib
+import streamlit as st
+import asyncio
 import google.generativeai as genai
 from sklearn.feature_extraction.text import TfidfVectorizer
 import numpy as np
+import ahocorasick
+import diskcache
 
-# --- Model Loading (Done once at startup) ---
-print("Loading AI models for scoring engine...")
-try:
-    nlp = spacy.load("en_core_web_sm")
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("AI models loaded successfully.")
-except Exception as e:
-    print(f"Error loading AI models: {e}. Please ensure models are downloaded.")
-    nlp = None
-    embedding_model = None
+# --- Model Loading (Done once, on first use) ---
+def _detect_device():
+    """Picks the fastest available device for the embedding model: CUDA, then Apple MPS, then CPU."""
+    import torch
+
+    try:
+        if torch.cuda.is_available():
+            return "cuda"
+        if torch.backends.mps.is_available():
+            return "mps"
+    except Exception:
+        pass
+    return "cpu"
+
+# Set EMBEDDING_BACKEND=onnx to serve the encoder through ONNX Runtime with int8 weights
+# (needs the optional onnxruntime, optimum and transformers packages; falls back to PyTorch otherwise).
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_EXPORT_DIR = "minilm_onnx"
+ONNX_MODEL_PATH = "minilm_int8.onnx"
+
+class ORTSentenceEncoder:
+    """
+    Runs the MiniLM encoder through an ONNX Runtime session.
+    Supports the subset of SentenceTransformer.encode() used by this module.
+    """
+    max_seq_length = 256  # same limit all-MiniLM-L6-v2 uses in sentence-transformers
+
+    def __init__(self, model_path, tokenizer):
+        import onnxruntime
+
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=sess_options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(
+                sentences[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np"
+            )
+            feeds = {name: array.astype(np.int64) for name, array in inputs.items() if name in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            batches.append(embeddings)
+
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, 384), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+def _load_onnx_encoder():
+    """Exports and int8-quantizes MiniLM on first use, then loads it into ONNX Runtime."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers import AutoTokenizer
+
+    if not os.path.exists(ONNX_MODEL_PATH):
+        from optimum.exporters.onnx import main_export
+
+        main_export(ONNX_MODEL_ID, output=ONNX_EXPORT_DIR, task="feature-extraction")
+        quantize_dynamic(
+            os.path.join(ONNX_EXPORT_DIR, "model.onnx"), ONNX_MODEL_PATH, weight_type=QuantType.QInt8
+        )
+    tokenizer = AutoTokenizer.from_pretrained(ONNX_MODEL_ID, use_fast=True)
+    return ORTSentenceEncoder(ONNX_MODEL_PATH, tokenizer)
+
+def _load_embedding_model():
+    """Loads the sentence encoder and returns it with a label for the backend/device it runs on."""
+    if EMBEDDING_BACKEND == "onnx":
+        try:
+            return _load_onnx_encoder(), "onnx-cpu"
+        except Exception as e:
+            print(f"ONNX encoder unavailable ({e}); falling back to PyTorch.")
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    device = _detect_device()
+    model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+    if device == "cpu":
+        # More than ~8 intra-op threads slows small transformer inference down
+        torch.set_num_threads(min(8, os.cpu_count() or 1))
+    else:
+        model.half()
+    return model, device
+
+class EmbeddingService:
+    """
+    Collects encode requests from concurrent callers and runs them through the model in batches.
+    A batch is flushed once `max_batch_size` texts are pending or `max_wait` seconds have passed.
+    """
+    def __init__(self, model, max_batch_size=32, max_wait=0.01):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    def encode(self, text):
+        """Queues a text; returns a Future that resolves to its unit-length float32 embedding."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Similar lengths together keep padding inside the batch to a minimum
+            batch.sort(key=lambda item: len(item[0]))
+            try:
+                embeddings = self.model.encode(
+                    [text for text, _ in batch], batch_size=self.max_batch_size, convert_to_numpy=True,
+                    normalize_embeddings=True, show_progress_bar=False
+                ).astype(np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+# The encoder is loaded on first use rather than at import, so processes that only compute
+# hard match scores (such as score_resumes workers) never load a model or start the service
+embedding_model = None
+embedding_service = None
+_embedding_backend_tag = b"torch"
+_embedding_load_attempted = False
+_embedding_load_lock = threading.Lock()
+
+def _get_embedding_model():
+    """Loads the sentence encoder and starts its batching service on first call. Returns None if loading failed."""
+    global embedding_model, embedding_service, _embedding_backend_tag, _embedding_load_attempted
+    with _embedding_load_lock:
+        if not _embedding_load_attempted:
+            _embedding_load_attempted = True
+            print("Loading AI models for scoring engine...")
+            try:
+                embedding_model, device = _load_embedding_model()
+                print(f"AI models loaded successfully (embeddings on {device}).")
+            except Exception as e:
+                print(f"Error loading AI models: {e}. Please ensure models are downloaded.")
+                embedding_model = None
+            if embedding_model:
+                embedding_service = EmbeddingService(embedding_model)
+                # ONNX int8 and PyTorch embeddings differ slightly, so each backend gets its own cache keys
+                if isinstance(embedding_model, ORTSentenceEncoder):
+                    _embedding_backend_tag = b"onnx"
+    return embedding_model
+
+# Resume/JD embeddings persist on disk as float16, keyed by a hash of the text, so a document
+# scored against several JDs (or across restarts) is only encoded once.
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", ".emb_cache")
+_EMB_CACHE = diskcache.Cache(EMBEDDING_CACHE_DIR)
+
+def _embedding_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16, person=_embedding_backend_tag).digest()
 
 # --- Scoring Functions ---
 
-def calculate_concept_match_score(jd_text, resume_text):
+# Same lower-casing, tokenizing and stop-word removal TfidfVectorizer(stop_words='english') applies
+_concept_analyzer = TfidfVectorizer(stop_words='english').build_analyzer()
+
+def _pretokenized(tokens):
+    return tokens
+
+@functools.lru_cache(maxsize=8)
+def _jd_concept_tokens(jd_text):
+    """Tokenizes a JD once so every resume scored against it reuses the result."""
+    return tuple(_concept_analyzer(jd_text))
+
+def _concept_score(jd_tokens, resume_text):
     """
-    Uses TF-IDF to find important concepts in the JD and checks their presence in the resume.
-    Returns a score between 0 and 100.
+    Fits TF-IDF on the JD/resume pair, keeps the JD terms weighted above 0.1 and
+    returns the percentage of them that appear in the resume.
     """
-    corpus = [jd_text, resume_text]
     try:
-        vectorizer = TfidfVectorizer(stop_words='english', max_features=25)
-        tfidf_matrix = vectorizer.fit_transform(corpus)
-        feature_names = vectorizer.get_feature_names_out()
-        jd_scores = tfidf_matrix[0].toarray().flatten()
-        
-        important_jd_words = [
-            feature_names[idx] for idx in np.argsort(jd_scores)[::-1] if jd_scores[idx] > 0.1
-        ]
-        
-        if not important_jd_words:
-            return 0
-        
-        resume_lower = resume_text.lower()
-        found_important_words = [word for word in important_jd_words if word in resume_lower]
-        
-        return (len(found_important_words) / len(important_jd_words)) * 100
+        # The texts are already tokenized, so the vectorizer only counts and weights them
+        vectorizer = TfidfVectorizer(analyzer=_pretokenized, max_features=25)
+        tfidf_matrix = vectorizer.fit_transform([jd_tokens, _concept_analyzer(resume_text)])
     except ValueError:
         # Happens if vocabulary is empty (e.g., all stop words)
         return 0
+    
+    feature_names = vectorizer.get_feature_names_out()
+    # Read the JD row's nonzero entries straight from the sparse matrix instead of densifying it
+    jd_row = tfidf_matrix.getrow(0)
+    important_jd_words = [feature_names[idx] for idx, score in zip(jd_row.indices, jd_row.data) if score > 0.1]
+    if not important_jd_words:
+        return 0
+    
+    resume_lower = resume_text.lower()
+    found_count = sum(1 for word in important_jd_words if word in resume_lower)
+    return (found_count / len(important_jd_words)) * 100
+
+def calculate_concept_match_score(jd_text, resume_text):
+    """
+    Uses TF-IDF to find important concepts in the JD and checks their presence in the resume.
+    Returns a score between 0 and 100.
+    """
+    return _concept_score(_jd_concept_tokens(jd_text), resume_text)
+
+def calculate_concept_match_score_batch(jd_text, resume_texts):
+    """Concept match scores for many resumes against one JD, one score per resume."""
+    jd_tokens = _jd_concept_tokens(jd_text)
+    return [_concept_score(jd_tokens, resume_text) for resume_text in resume_texts]
+
+# "5 years", "3+ yrs", "2.5 years" ...; IGNORECASE avoids lower-casing the whole text first
+_YEARS_RE = re.compile(r'(\d+\.?\d*)\s*\+?\s*(?:years|yrs)', re.IGNORECASE)
+
+def _max_years(text):
+    """Returns the largest number of years mentioned in the text, or 0."""
+    return max((float(match) for match in _YEARS_RE.findall(text)), default=0)
 
 def extract_experience(resume_text):
     """
     Extracts the highest number of years of experience from resume text using regex.
     """
-    patterns = [r'(\d+\.?\d*)\s*\+?\s*years', r'(\d+\.?\d*)\s*\+?\s*yrs']
-    found_years = []
-    for pattern in patterns:
-        matches = re.findall(pattern, resume_text.lower())
-        for match in matches:
-            try:
-                found_years.append(float(match))
-            except ValueError:
-                continue
-    return max(found_years) if found_years else 0
+    return _max_years(resume_text)
 
 def check_experience_requirement(jd_text, resume_experience_years):
     """
     Checks if the resume's experience meets the requirement from the JD.
     """
-    jd_patterns = [r'(\d+\.?\d*)\s*\+?\s*years', r'(\d+\.?\d*)\s*\+?\s*yrs']
-    jd_required_years = 0
-    for pattern in jd_patterns:
-        matches = re.findall(pattern, jd_text.lower())
-        for match in matches:
-            try:
-                jd_required_years = max(jd_required_years, float(match))
-            except ValueError:
-                continue
-    
+    return _experience_score(_max_years(jd_text), resume_experience_years)
+
+def _experience_score(jd_required_years, resume_experience_years):
     if jd_required_years == 0:
         return 100  # No requirement found, so they meet it.
     
@@ -83,37 +276,97 @@ def check_experience_requirement(jd_text, resume_experience_years):
     else:
         return max(0, (resume_experience_years / jd_required_years) * 100)
 
+# Phrases that mark a JD's skills as must-have rather than good-to-have
+MUST_HAVE_PHRASES = ["must have", "required", "essential", "proficient in", "need to have"]
+
+class SkillsLibrary(dict):
+    """
+    Normalized skills library: skill -> frozenset of lower-cased variations.
+    Also carries an Aho-Corasick automaton over every variation, so a text is scanned once for all skills.
+    Internally a set of skills is an int bitmask, where bit i stands for the i-th skill.
+    """
+    def __init__(self, skills):
+        super().__init__(skills)
+        self.names = list(self)
+        self.index = {skill: i for i, skill in enumerate(self.names)}
+
+        # A variation can belong to more than one skill, so map each to all of its skills
+        mask_by_variation = {}
+        for skill, variations in self.items():
+            for variation in variations:
+                mask_by_variation[variation] = mask_by_variation.get(variation, 0) | (1 << self.index[skill])
+
+        self.automaton = ahocorasick.Automaton()
+        for variation, mask in mask_by_variation.items():
+            self.automaton.add_word(variation, mask)
+        self.automaton.make_automaton()
+
+    def to_mask(self, skills):
+        """Converts a collection of skill names to a bitmask."""
+        mask = 0
+        for skill in skills:
+            mask |= 1 << self.index[skill]
+        return mask
+
+    def to_skills(self, mask):
+        """Converts a bitmask back to a set of skill names."""
+        skills = set()
+        while mask:
+            lowest = mask & -mask
+            skills.add(self.names[lowest.bit_length() - 1])
+            mask ^= lowest
+        return skills
+
+    def find_skill_mask(self, text_lower, wanted=None):
+        """
+        Returns the bitmask of skills with at least one variation occurring in the (lower-cased) text.
+        If the `wanted` mask is given, scanning stops as soon as all of those skills have been seen.
+        """
+        found = 0
+        if wanted == 0:
+            return found
+        
+        for _, mask in self.automaton.iter(text_lower):
+            found |= mask
+            if wanted is not None and found & wanted == wanted:
+                break
+        return found
+
+    def find_skills(self, text_lower):
+        """Returns every skill with at least one variation occurring in the (lower-cased) text."""
+        return self.to_skills(self.find_skill_mask(text_lower))
+
+def normalize_skills_library(skills_library):
+    """
+    Lower-cases every skill variation once, adding the skill name itself as a variation.
+    The skill functions below expect a library in this form.
+    """
+    normalized = {}
+    for skill, variations in skills_library.items():
+        variations = {variation.lower() for variation in variations} | {skill.lower()}
+        # Interned names hash once and compare by identity across every scoring call
+        normalized[sys.intern(skill)] = frozenset(sys.intern(variation) for variation in variations)
+    return SkillsLibrary(normalized)
+
 def extract_skills_from_jd(jd_text, skills_library):
     """
     Extracts must-have and good-to-have skills from JD text.
+    `skills_library` must come from normalize_skills_library().
     """
     jd_text_lower = jd_text.lower()
-    must_have_skills = set()
-    good_to_have_skills = set()
+    found_skills = skills_library.find_skills(jd_text_lower)
     
-    for skill, variations in skills_library.items():
-        for variation in variations + [skill.lower()]:
-            if variation in jd_text_lower:
-                if any(phrase in jd_text_lower for phrase in ["must have", "required", "essential", "proficient in", "need to have"]):
-                    must_have_skills.add(skill)
-                else:
-                    good_to_have_skills.add(skill)
-                break
-    return must_have_skills, good_to_have_skills
+    # The must-have phrases apply to the whole JD, so every skill found lands in the same bucket
+    if any(phrase in jd_text_lower for phrase in MUST_HAVE_PHRASES):
+        return found_skills, set()
+    return set(), found_skills
 
 def check_skills_in_resume(resume_text, must_have, good_to_have, skills_library):
     """Checks for the presence of required skills in the resume."""
-    resume_text_lower = resume_text.lower()
-    found_must = set()
-    found_good = set()
-    
-    for skill_set, found_set in [(must_have, found_must), (good_to_have, found_good)]:
-        for skill in skill_set:
-            for variation in skills_library[skill] + [skill.lower()]:
-                if variation in resume_text_lower:
-                    found_set.add(skill)
-                    break
-    return found_must, found_good
+    must_mask = skills_library.to_mask(must_have)
+    good_mask = skills_library.to_mask(good_to_have)
+    found = skills_library.find_skill_mask(resume_text.lower(), wanted=must_mask | good_mask)
+    return skills_library.to_skills(found & must_mask), skills_library.to_skills(found & good_mask)
 
 def calculate_skill_score(found_must, found_good, must_have, good_to_have):
     """
@@ -126,19 +379,63 @@ def calculate_skill_score(found_must, found_good, must_have, good_to_have):
     score = (must_have_ratio * 0.7) + (good_to_have_ratio * 0.3)
     return score * 100
 
+# No spinner: this runs inside the app's scoring threads, outside the script thread
+@st.cache_data(max_entries=200, show_spinner=False)
+def _embed(text_hash, _text):
+    """Returns the unit-length sentence embedding for a document, cached per text hash."""
+    key = _embedding_key(_text)
+    embedding = _EMB_CACHE.get(key)
+    if embedding is None:
+        # Concurrent sessions share the model through the batching service
+        embedding = embedding_service.encode(_text).result().astype(np.float16)
+        _EMB_CACHE[key] = embedding
+    return embedding.astype(np.float32)
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 def calculate_semantic_similarity(jd_text, resume_text):
     """Calculates semantic similarity using sentence embeddings."""
-    if not embedding_model:
+    if not _get_embedding_model():
         return 0.0
 
-    # Encode texts into embeddings
-    jd_embedding = embedding_model.encode(jd_text, convert_to_tensor=True)
-    resume_embedding = embedding_model.encode(resume_text, convert_to_tensor=True)
+    # Encode texts into embeddings (each document is embedded once and reused across pairs)
+    jd_embedding = _embed(_text_hash(jd_text), jd_text)
+    resume_embedding = _embed(_text_hash(resume_text), resume_text)
     
-    # Calculate cosine similarity
-    cosine_score = util.pytorch_cos_sim(jd_embedding, resume_embedding).item()
+    # Embeddings are normalized, so cosine similarity is a plain dot product
+    cosine_score = float(np.dot(jd_embedding, resume_embedding))
     return max(0, cosine_score * 100) # Ensure score is non-negative
 
+def calculate_semantic_similarity_batch(jd_text, resume_texts):
+    """
+    Scores many resumes against one JD.
+    The JD is embedded once and resumes missing from the embedding cache are encoded in a single batched pass.
+    Returns a NumPy array of scores between 0 and 100, one per resume.
+    """
+    if not resume_texts or not _get_embedding_model():
+        return np.zeros(len(resume_texts))
+
+    jd_embedding = _embed(_text_hash(jd_text), jd_text)
+    
+    keys = [_embedding_key(text) for text in resume_texts]
+    embeddings = [_EMB_CACHE.get(key) for key in keys]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        encoded = embedding_model.encode(
+            [resume_texts[i] for i in missing], batch_size=64, convert_to_numpy=True,
+            normalize_embeddings=True, show_progress_bar=False
+        ).astype(np.float16)
+        for i, embedding in zip(missing, encoded):
+            _EMB_CACHE[keys[i]] = embedding
+            embeddings[i] = embedding
+    # float32 so half-precision storage doesn't lose accuracy in the products below
+    resume_embeddings = np.stack(embeddings).astype(np.float32)
+    
+    # One matrix-vector product gives every cosine score
+    scores = resume_embeddings @ jd_embedding
+    return np.maximum(scores * 100, 0)
+
 def extract_education(resume_text):
     """Extracts common degree patterns from resume text."""
     education_keywords = ["bachelor", "master", "phd", "b.sc", "m.sc", "b.tech", "m.tech", "b.e.", "m.e.", "degree", "diploma"]
@@ -157,25 +454,23 @@ def check_education_requirement(jd_text, resume_education):
 
 # --- Main Scoring Orchestrator ---
 
-def calculate_hard_match_score(jd_text, resume_text, skills_library):
-    """
-    Calculates the overall hard match score based on weighted components.
-    """
-    # Skills (40%)
+def _skill_component(jd_text, resume_text, skills_library):
     must_have, good_to_have = extract_skills_from_jd(jd_text, skills_library)
     found_must, found_good = check_skills_in_resume(resume_text, must_have, good_to_have, skills_library)
     skill_score = calculate_skill_score(found_must, found_good, must_have, good_to_have)
-    
-    # Education (20%)
+    return must_have, good_to_have, found_must, found_good, skill_score
+
+def _education_component(jd_text, resume_text):
     resume_education = extract_education(resume_text)
-    education_score = check_education_requirement(jd_text, resume_education)
-    
-    # Concepts (30%)
-    concept_score = calculate_concept_match_score(jd_text, resume_text)
-    
-    # Experience (10%)
+    return check_education_requirement(jd_text, resume_education)
+
+def _experience_component(jd_text, resume_text):
     resume_exp_years = extract_experience(resume_text)
-    exp_score = check_experience_requirement(jd_text, resume_exp_years)
+    return check_experience_requirement(jd_text, resume_exp_years)
+
+def _combine_hard_match(skills, education_score, concept_score, exp_score):
+    """Applies the component weights and builds the score breakdown."""
+    must_have, good_to_have, found_must, found_good, skill_score = skills
     
     # Apply weights
     hard_score = (skill_score * 0.4) + (education_score * 0.2) + (concept_score * 0.3) + (exp_score * 0.1)
@@ -187,50 +482,189 @@ def calculate_hard_match_score(jd_text, resume_text, skills_library):
         "concept_score": concept_score, "experience_score": exp_score
     }
 
-def generate_gemini_feedback(jd_text, resume_text, missing_skills, final_score, found_skills, api_key):
+def calculate_hard_match_score(jd_text, resume_text, skills_library):
     """
-    Generate personalized feedback for the candidate using Google's Gemini model.
+    Calculates the overall hard match score based on weighted components.
     """
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-pro")
-        
-        prompt = f"""
-        Analyze the following job description and resume to provide constructive, actionable feedback for the candidate.
+    return _combine_hard_match(
+        _skill_component(jd_text, resume_text, skills_library),      # Skills (40%)
+        _education_component(jd_text, resume_text),                  # Education (20%)
+        calculate_concept_match_score(jd_text, resume_text),         # Concepts (30%)
+        _experience_component(jd_text, resume_text),                 # Experience (10%)
+    )
 
-        **JOB DESCRIPTION (Excerpt):**
-        {jd_text[:500]}...
+async def calculate_hard_match_score_async(jd_text, resume_text, skills_library):
+    """
+    Async variant of calculate_hard_match_score.
+    The four independent components run concurrently on the default executor.
+    """
+    loop = asyncio.get_running_loop()
+    components = await asyncio.gather(
+        loop.run_in_executor(None, _skill_component, jd_text, resume_text, skills_library),
+        loop.run_in_executor(None, _education_component, jd_text, resume_text),
+        loop.run_in_executor(None, calculate_concept_match_score, jd_text, resume_text),
+        loop.run_in_executor(None, _experience_component, jd_text, resume_text),
+    )
+    return _combine_hard_match(*components)
 
-        **RESUME (Excerpt):**
-        {resume_text[:600]}...
+# --- Bulk Scoring ---
 
-        **AUTOMATED ANALYSIS:**
-        - Overall Match Score: {final_score:.1f}/100
-        - Skills Found: {', '.join(found_skills) if found_skills else 'None of the key skills were explicitly found.'}
-        - Key Missing Skills: {', '.join(missing_skills) if missing_skills else 'All key skills appear to be present.'}
+def _prepare_jd(jd_text, skills_library):
+    """Does the JD-side work once so it can be shared by every resume scored against the JD."""
+    must_have, good_to_have = extract_skills_from_jd(jd_text, skills_library)
+    return {
+        "jd_text": jd_text,
+        "must_have": must_have,
+        "good_to_have": good_to_have,
+        "concept_tokens": _jd_concept_tokens(jd_text),
+        "required_years": _max_years(jd_text),
+    }
 
-        **INSTRUCTIONS:**
-        Act as an expert career coach. Provide feedback in the following Markdown format. Be specific, professional, and encouraging.
+def _score_prepared_resume(prepared_jd, skills_library, resume_text):
+    """Hard match score for one resume against a JD prepared by _prepare_jd()."""
+    must_have, good_to_have = prepared_jd["must_have"], prepared_jd["good_to_have"]
+    found_must, found_good = check_skills_in_resume(resume_text, must_have, good_to_have, skills_library)
+    skill_score = calculate_skill_score(found_must, found_good, must_have, good_to_have)
+    
+    return _combine_hard_match(
+        (must_have, good_to_have, found_must, found_good, skill_score),
+        _education_component(prepared_jd["jd_text"], resume_text),
+        _concept_score(prepared_jd["concept_tokens"], resume_text),
+        _experience_score(prepared_jd["required_years"], extract_experience(resume_text)),
+    )
 
-        ---
+def score_resumes(jd_text, resume_texts, skills_library, max_workers=None):
+    """
+    Calculates hard match scores for many resumes against one JD across worker processes.
+    Returns a list of (hard_score, breakdown) tuples in the same order as resume_texts.
+    """
+    prepared_jd = _prepare_jd(jd_text, skills_library)
+    score_one = functools.partial(_score_prepared_resume, prepared_jd, skills_library)
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(score_one, resume_texts, chunksize=8))
+
+def rank_resumes(jd_text, resume_texts, skills_library, top_k=None, max_workers=None):
+    """
+    Hard-scores many resumes against one JD (see score_resumes) and ranks them.
+    Returns (indices, scores) as NumPy arrays, best first; only the best `top_k` if given.
+    """
+    results = score_resumes(jd_text, resume_texts, skills_library, max_workers=max_workers)
+    hard_scores = np.fromiter((hard_score for hard_score, _ in results), dtype=np.float64, count=len(results))
+    
+    if top_k is not None and top_k < len(hard_scores):
+        if top_k <= 0:
+            return np.array([], dtype=np.intp), np.array([], dtype=np.float64)
+        # Partial selection of the top_k, then sort just those
+        candidates = np.argpartition(-hard_scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(hard_scores))
+    order = candidates[np.argsort(-hard_scores[candidates], kind="stable")]
+    return order, hard_scores[order]
 
-        ### 🎯 Executive Summary
-        *Provide a 2-3 sentence overview of the candidate's alignment with the role based on the provided data.*
+# Gemini calls that take longer than this are abandoned so they can't stall the scoring flow
+GEMINI_TIMEOUT_SECONDS = 15
+# Token budget for each of the JD and resume excerpts in the prompt (~4 characters per token)
+EXCERPT_TOKENS = 400
 
-        ### ✅ Strengths
-        - **Strength 1:** *Mention a specific strength, such as a key skill they possess or relevant experience.*
-        - **Strength 2:** *Mention another positive alignment.*
-        - **Strength 3:** *Highlight a third area where they are a good fit.*
+@functools.lru_cache(maxsize=4)
+def _get_gemini(api_key):
+    """Configures the Gemini SDK and builds the model once per API key."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel("gemini-pro")
 
-        ### 💡 Areas for Improvement
-        - **Most Critical Gap:** *Identify the most significant missing skill or experience and suggest a clear, actionable way to address it (e.g., a specific online course, a type of project to build).*
-        - **Resume Tailoring:** *Suggest a specific change to their resume to better highlight their fit for this particular job (e.g., "Consider adding a project that demonstrates your experience with 'Python' and 'data analysis' to the top of your experience section.").*
-        - **Interview Preparation:** *Advise them on what to emphasize during an interview to overcome any perceived gaps.*
-        """
+def _excerpt(text, max_tokens=EXCERPT_TOKENS):
+    """Truncates text to roughly max_tokens tokens, cutting at a word boundary."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(None, 1)
+    # An all-whitespace prefix splits into nothing; fall back to the raw prefix
+    return (cut[0] if cut else text[:max_chars]) + "..."
+
+def _build_feedback_prompt(jd_text, resume_text, missing_skills, final_score, found_skills):
+    """Builds the career-coach prompt sent to Gemini."""
+    return f"""
+    Analyze the following job description and resume to provide constructive, actionable feedback for the candidate.
+
+    **JOB DESCRIPTION (Excerpt):**
+    {_excerpt(jd_text)}
+
+    **RESUME (Excerpt):**
+    {_excerpt(resume_text)}
+
+    **AUTOMATED ANALYSIS:**
+    - Overall Match Score: {final_score:.1f}/100
+    - Skills Found: {', '.join(found_skills) if found_skills else 'None of the key skills were explicitly found.'}
+    - Key Missing Skills: {', '.join(missing_skills) if missing_skills else 'All key skills appear to be present.'}
+
+    **INSTRUCTIONS:**
+    Act as an expert career coach. Provide feedback in the following Markdown format. Be specific, professional, and encouraging.
+
+    ---
+
+    ### 🎯 Executive Summary
+    *Provide a 2-3 sentence overview of the candidate's alignment with the role based on the provided data.*
+
+    ### ✅ Strengths
+    - **Strength 1:** *Mention a specific strength, such as a key skill they possess or relevant experience.*
+    - **Strength 2:** *Mention another positive alignment.*
+    - **Strength 3:** *Highlight a third area where they are a good fit.*
+
+    ### 💡 Areas for Improvement
+    - **Most Critical Gap:** *Identify the most significant missing skill or experience and suggest a clear, actionable way to address it (e.g., a specific online course, a type of project to build).*
+    - **Resume Tailoring:** *Suggest a specific change to their resume to better highlight their fit for this particular job (e.g., "Consider adding a project that demonstrates your experience with 'Python' and 'data analysis' to the top of your experience section.").*
+    - **Interview Preparation:** *Advise them on what to emphasize during an interview to overcome any perceived gaps.*
+    """
+
+def _feedback_text(response):
+    """Extracts the feedback text from a Gemini response."""
+    return response.text.strip() if hasattr(response, "text") and response.text else "⚠️ AI feedback could not be generated."
+
+def generate_gemini_feedback(jd_text, resume_text, missing_skills, final_score, found_skills, api_key):
+    """
+    Generate personalized feedback for the candidate using Google's Gemini model.
+    """
+    try:
+        model = _get_gemini(api_key)
+        prompt = _build_feedback_prompt(jd_text, resume_text, missing_skills, final_score, found_skills)
 
-        response = model.generate_content(prompt)
-        return response.text.strip() if hasattr(response, "text") and response.text else "⚠️ AI feedback could not be generated."
+        response = model.generate_content(prompt, request_options={"timeout": GEMINI_TIMEOUT_SECONDS})
+        return _feedback_text(response)
         
     except Exception as e:
         print(f"Gemini API Error: {str(e)}")
         return f"⚠️ Could not generate AI feedback due to an error: {str(e)}"
+
+async def generate_gemini_feedback_async(jd_text, resume_text, missing_skills, final_score, found_skills, api_key):
+    """
+    Async variant of generate_gemini_feedback, so several requests can be in flight at once.
+    """
+    try:
+        model = _get_gemini(api_key)
+        prompt = _build_feedback_prompt(jd_text, resume_text, missing_skills, final_score, found_skills)
+
+        response = await model.generate_content_async(prompt, request_options={"timeout": GEMINI_TIMEOUT_SECONDS})
+        return _feedback_text(response)
+
+    except Exception as e:
+        print(f"Gemini API Error: {str(e)}")
+        return f"⚠️ Could not generate AI feedback due to an error: {str(e)}"
+
+async def generate_feedback_batch(candidates, api_key, concurrency=8):
+    """
+    Generates feedback for many candidates concurrently.
+    Each candidate is a dict of generate_gemini_feedback's arguments (without api_key).
+    At most `concurrency` requests are in flight at once, to stay within Gemini rate limits.
+    Returns the feedback strings in the same order as candidates; a failed candidate gets an error message.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(candidate):
+        async with semaphore:
+            return await generate_gemini_feedback_async(**candidate, api_key=api_key)
+
+    results = await asyncio.gather(*(_one(candidate) for candidate in candidates), return_exceptions=True)
+    return [
+        f"⚠️ Could not generate AI feedback due to an error: {str(result)}" if isinstance(result, Exception) else result
+        for result in results
+    ]